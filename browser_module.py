@@ -4,50 +4,139 @@ Visits quiz URLs, executes JavaScript, and extracts quiz content
 """
 
 import asyncio
-import base64
 import re
 from typing import Dict, Optional
 
-from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+from playwright.async_api import Page, Route, async_playwright, TimeoutError as PlaywrightTimeout
+
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the stdlib module
+except ImportError:
+    import base64
+
+try:
+    import re2  # linear-time matching for the submit URL scan
+except ImportError:
+    re2 = re
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # fall back to the regex cleaner
+    HTMLParser = None
+
+# Resource types the quiz text never depends on
+BLOCKED_RESOURCES = {'image', 'font', 'media', 'stylesheet', 'beacon', 'imageset', 'texttrack'}
+
+# Quiz content selectors, in priority order
+QUIZ_SELECTORS = ['#result', '#quiz', '#content', '.quiz-content', 'body']
+
+# Returns the text of the first selector with meaningful content
+_FIRST_TEXT_JS = """(sels) => {
+    for (const s of sels) {
+        const el = document.querySelector(s);
+        if (el && el.innerText && el.innerText.trim().length > 50) return el.innerText.trim();
+    }
+    return null;
+}"""
+
+# Precompiled patterns used on every quiz page
+_B64_RE = re.compile(r'atob\([`"\']([A-Za-z0-9+/=]+)[`"\']\)')
+_SCRIPT_RE = re.compile(r'<script[^>]*>.*?</script>', re.DOTALL | re.IGNORECASE)
+_STYLE_RE = re.compile(r'<style[^>]*>.*?</style>', re.DOTALL | re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+_WS_RE = re.compile(r'\s+')
+
+# Submit URL: group 1 is a URL ending in /submit, group 2 follows "Post ... to".
+# The "Post ... to" span can't contain ':', so it never swallows a URL.
+_SUBMIT_RE = re2.compile(
+    r'(https?://[^\s<>"{}|\\^`\[\]]+/submit[^\s<>"{}|\\^`\[\]]*)'
+    r'|(?i:Post[^:\n]*?to)\s+(https?://[^\s<>"{}|\\^`\[\]]+)'
+)
 
 class QuizBrowser:
     """Handles browser automation for quiz pages"""
     
-    def __init__(self, headless: bool = True):
+    def __init__(self, headless: bool = True, max_pages: int = 1):
         """
         Initialize browser
         Args:
             headless: Run browser in headless mode (no visible window)
+            max_pages: Number of pages that can visit quizzes at the same time
         """
         self.headless = headless
+        self.max_pages = max_pages
         self.playwright = None
         self.browser = None
-        self.context = None
-        self.page = None
+        self._pool = None
+        self._pages = set()
     
     async def start(self):
-        """Start the browser"""
+        """Start the browser and fill the page pool"""
         print("🌐 Starting browser...")
         if self.playwright:
             print("⚠ Browser already running")
             return
         self.playwright = await async_playwright().start()
         self.browser = await self.playwright.chromium.launch(headless=self.headless)
-        self.context = await self.browser.new_context(
+        self._pool = asyncio.Queue()
+        for _ in range(self.max_pages):
+            self._pool.put_nowait(await self._new_page())
+        print(f"✓ Browser started ({self.max_pages} page(s))")
+    
+    async def _new_page(self) -> Page:
+        """Open a page in its own context so cookies and storage stay isolated"""
+        context = await self.browser.new_context(
             viewport={'width': 1920, 'height': 1080},
             user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         )
-        self.page = await self.context.new_page()
-        print("✓ Browser started")
+        await context.route("**/*", self._block_resources)
+        page = await context.new_page()
+        self._pages.add(page)
+        return page
+    
+    async def _block_resources(self, route: Route):
+        """Skip downloads that don't affect quiz text (images, fonts, CSS...)"""
+        if route.request.resource_type in BLOCKED_RESOURCES:
+            await route.abort()
+        else:
+            await route.continue_()
+    
+    async def _close_page(self, page: Page):
+        """Close a page together with its context"""
+        self._pages.discard(page)
+        await page.context.close()
+    
+    async def acquire(self) -> Page:
+        """
+        Wait for a free page from the pool
+        Slots freed by release() are refilled here with a fresh context
+        """
+        page = await self._pool.get()
+        if page is None:
+            try:
+                page = await self._new_page()
+            except Exception:
+                self._pool.put_nowait(None)  # keep the slot for the next caller
+                raise
+        return page
+    
+    async def release(self, page: Page):
+        """
+        Return a page's slot to the pool
+        The used context is closed so the next quiz starts clean
+        """
+        if self._pool is not None:
+            self._pool.put_nowait(None)
+        try:
+            await self._close_page(page)
+        except Exception as e:
+            print(f"⚠ Failed to close page: {e}")
     
     async def stop(self):
         """Clean up browser resources"""
-        if self.page:
-            await self.page.close()
-            self.page = None
-        if self.context:
-            await self.context.close()
-            self.context = None
+        for page in list(self._pages):
+            await self._close_page(page)
+        self._pool = None
         if self.browser:
             await self.browser.close()
             self.browser = None
@@ -56,22 +145,30 @@ class QuizBrowser:
             self.playwright = None
         print("✓ Browser stopped")
     
-    async def visit_quiz_page(self, url: str, timeout: int = 30000) -> Dict:
+    async def visit_quiz_page(self, url: str, timeout: int = 30000, page: Optional[Page] = None) -> Dict:
         """
         Visit a quiz URL and extract the quiz content
         
         Args:
             url: The quiz page URL
             timeout: Page load timeout in milliseconds
+            page: Page to use; if not given one is taken from the pool
             
         Returns:
             Dict with quiz_text, submit_url, and raw_html
         """
+        if page is None:
+            page = await self.acquire()
+            try:
+                return await self.visit_quiz_page(url, timeout, page)
+            finally:
+                await self.release(page)
+        
         print(f"📄 Visiting: {url}")
         
         try:
             # Navigate to the page
-            response = await self.page.goto(url, wait_until="networkidle", timeout=timeout)
+            response = await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
             
             if not response or response.status != 200:
                 return {
@@ -79,14 +176,18 @@ class QuizBrowser:
                     "url": url
                 }
             
-            # Wait for any dynamic content to load
-            await self.page.wait_for_timeout(2000)  # 2 second wait for JS execution
+            # Wait until a quiz selector has meaningful text (the same check
+            # extraction uses), capped at the old fixed 2s sleep
+            try:
+                await page.wait_for_function(_FIRST_TEXT_JS, arg=QUIZ_SELECTORS, timeout=2000)
+            except PlaywrightTimeout:
+                pass  # Use whatever has rendered so far
             
             # Get the rendered HTML content
-            html_content = await self.page.content()
+            html_content = await page.content()
             
             # Try to extract quiz text from common elements
-            quiz_text = await self._extract_quiz_content(html_content)
+            quiz_text = await self._extract_quiz_content(html_content, page)
             
             # Try to extract submission URL
             submit_url = self._extract_submit_url(quiz_text)
@@ -115,51 +216,62 @@ class QuizBrowser:
                 "url": url
             }
     
-    async def _extract_quiz_content(self, html: str) -> str:
+    async def _extract_quiz_content(self, html: str, page: Page) -> str:
         """
         Extract and decode quiz content from HTML
-        Handles base64 encoded content in script tags
+        Prefers the rendered DOM text; falls back to decoding base64
+        content in script tags when the page hasn't rendered it
         """
-        # Try to find base64 encoded content in script tags
-        base64_pattern = r'atob\([`"\']([A-Za-z0-9+/=]+)[`"\']\)'
-        matches = re.findall(base64_pattern, html)
+        # The page has usually already run atob() and rendered the text
+        try:
+            # Check all selectors in one round-trip to the page
+            text = await page.evaluate(_FIRST_TEXT_JS, QUIZ_SELECTORS)
+            if text:
+                return text
+        except Exception as e:
+            print(f"⚠ Error extracting text: {e}")
         
+        # Try to find base64 encoded content in script tags
         decoded_parts = []
-        for encoded in matches:
+        for encoded in _B64_RE.findall(html):
             try:
-                decoded = base64.b64decode(encoded).decode('utf-8')
-                decoded_parts.append(decoded)
+                decoded_parts.append(base64.b64decode(encoded, validate=False))
             except Exception as e:
                 print(f"⚠ Failed to decode base64: {e}")
         
         # If we found decoded content, use it
         if decoded_parts:
-            return '\n\n'.join(decoded_parts)
-        
-        # Otherwise, try to get text from result div or body
-        try:
-            if self.page:
-                # Try common quiz content selectors
-                selectors = ['#result', '#quiz', '#content', '.quiz-content', 'body']
-                for selector in selectors:
-                    try:
-                        text = await self.page.text_content(selector, timeout=1000)
-                        if text and len(text.strip()) > 50:  # Meaningful content
-                            return text.strip()
-                    except Exception:
-                        continue
-        except Exception as e:
-            print(f"⚠ Error extracting text: {e}")
+            return b'\n\n'.join(decoded_parts).decode('utf-8', errors='replace')
         
         # Fallback: return cleaned HTML
         return self._clean_html(html)
     
+    def _parse_html(self, html: str):
+        """Parse HTML with selectolax and drop script and style nodes"""
+        tree = HTMLParser(html)
+        for node in tree.css('script, style'):
+            node.decompose()
+        return tree
+    
+    def _tree_text(self, tree) -> str:
+        """Get whitespace-collapsed text from a parsed tree"""
+        root = tree.body or tree.root
+        if root is None:
+            return ''
+        return ' '.join(root.text(separator=' ', strip=True).split())
+    
     def _clean_html(self, html: str) -> str:
-        """Remove script and style tags from HTML"""
-        html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
-        html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
-        html = re.sub(r'<[^>]+>', ' ', html)
-        html = re.sub(r'\s+', ' ', html)
+        """
+        Remove script and style tags from HTML and return its text
+        Uses selectolax when installed, regex passes otherwise
+        """
+        if HTMLParser is not None:
+            return self._tree_text(self._parse_html(html))
+        
+        html = _SCRIPT_RE.sub('', html)
+        html = _STYLE_RE.sub('', html)
+        html = _TAG_RE.sub(' ', html)
+        html = _WS_RE.sub(' ', html)
         return html.strip()
     
     def _extract_submit_url(self, text: str) -> Optional[str]:
@@ -167,21 +279,15 @@ class QuizBrowser:
         Extract the submission URL from quiz text
         Looks for patterns like: "Post your answer to https://..."
         """
-        # Pattern to find URLs in text
-        url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+/submit[^\s<>"{}|\\^`\[\]]*'
-        matches = re.findall(url_pattern, text)
-        
-        if matches:
-            return matches[0]
-        
-        # Broader pattern if specific submit URL not found
-        url_pattern_broad = r'Post.*?to\s+(https?://[^\s<>"{}|\\^`\[\]]+)'
-        matches = re.findall(url_pattern_broad, text, re.IGNORECASE)
-        
-        if matches:
-            return matches[0]
+        # One scan for both patterns; a /submit URL wins over "Post ... to"
+        post_url = None
+        for match in _SUBMIT_RE.finditer(text):
+            if match.group(1):
+                return match.group(1)
+            if post_url is None:
+                post_url = match.group(2)
         
-        return None
+        return post_url
 
 
 # Test function
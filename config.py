@@ -13,7 +13,12 @@ YOUR_SECRET = os.getenv("YOUR_SECRET", "jfhd8f79093ujfkjdf03ur73skgh")
 # API keys
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 
+# LLM response cache
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", ".llm_cache")
+LLM_CACHE_TTL = 86400  # 1 day
+
 # Settings
 SERVER_PORT = 7860
 QUIZ_DEADLINE = 180  # 3 minutes
 HEADLESS_BROWSER = True
+BROWSER_POOL_SIZE = 4  # pages shared by concurrent /quiz requests
@@ -3,22 +3,84 @@ Quiz Solver - All quiz solving logic in one file
 Combines LLM, data processing, visualization, and quiz orchestration
 """
 import re
-import json
+import orjson
+import asyncio
 import io
-import base64
-import requests
-import pandas as pd
-import pdfplumber
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import google.generativeai as genai
+import hashlib
+import math
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import httpx
+from diskcache import Cache
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the stdlib module
+except ImportError:
+    import base64
 from browser_module import QuizBrowser
-from config import YOUR_EMAIL, YOUR_SECRET, GOOGLE_API_KEY
+from config import YOUR_EMAIL, YOUR_SECRET, GOOGLE_API_KEY, LLM_CACHE_DIR, LLM_CACHE_TTL
+
+# ===== Regex Patterns =====
+_NUM_RE = re.compile(r'-?\d+\.?\d*')
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+_JSON_BRACE_RE = re.compile(r'(\{.*\})', re.DOTALL)
+_WORD_RE = re.compile(r'\w+')
+
+# Instruction keyword -> Series method, checked in order (None means row count)
+_OPERATIONS = (
+    ('sum', 'sum'),
+    ('average', 'mean'),
+    ('mean', 'mean'),
+    ('count', None),
+    ('max', 'max'),
+    ('min', 'min'),
+)
+
+# ===== Lazy Imports =====
+# pandas, matplotlib and the Gemini SDK are slow to import, so they load on
+# first use instead of when the server starts
+
+_pd = None
+_plt = None
+_model = None
+
+def _pandas():
+    """Import pandas on first use"""
+    global _pd
+    if _pd is None:
+        import pandas
+        _pd = pandas
+    return _pd
+
+def _pyplot():
+    """Import matplotlib (Agg backend) on first use"""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot
+        _plt = matplotlib.pyplot
+    return _plt
 
 # ===== LLM Setup =====
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('models/gemini-2.5-pro')
+
+def _get_model():
+    """Configure Gemini and create the model on first use"""
+    global _model
+    if _model is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GOOGLE_API_KEY)
+        _model = genai.GenerativeModel('models/gemini-2.5-pro')
+    return _model
+
+# Parsed quiz analyses cached on disk, keyed by quiz text hash, so retries
+# skip the API call
+_LLM_CACHE = Cache(LLM_CACHE_DIR)
+
+def ask_llm(prompt):
+    """Send a prompt to the LLM"""
+    response = _get_model().generate_content(prompt)
+    return response.text.strip()
 
 
 # ===== LLM Functions =====
@@ -37,130 +99,232 @@ Reply in JSON format with:
 
 JSON only:"""
 
-    response = model.generate_content(prompt)
-    text = response.text.strip()
+    key = hashlib.blake2b(quiz_text.encode('utf-8'), digest_size=16).hexdigest()
+    result = _LLM_CACHE.get(key)
+    if result is not None:
+        return result
+    
+    text = ask_llm(prompt)
     
-    # Try to get JSON from response
+    # Try to get JSON from response (fenced block first, then bare braces)
+    match = _JSON_FENCE_RE.search(text) or _JSON_BRACE_RE.search(text)
+    payload = match.group(1) if match else text
     try:
-        # Remove markdown code blocks if present
-        if '```' in text:
-            text = text.split('```')[1]
-            if text.startswith('json'):
-                text = text[4:]
-        
-        result = json.loads(text)
-        return result
-    except:
-        # Simple fallback
-        return {
-            "task_type": "calculation",
-            "instructions": quiz_text,
-            "data_sources": [],
-            "answer_type": "string"
-        }
+        result = orjson.loads(payload)
+        if isinstance(result, dict):
+            # Only cache replies that parsed, so a bad reply gets retried
+            _LLM_CACHE.set(key, result, expire=LLM_CACHE_TTL)
+            return result
+    except orjson.JSONDecodeError:
+        pass
+    
+    # Simple fallback
+    return {
+        "task_type": "calculation",
+        "instructions": quiz_text,
+        "data_sources": [],
+        "answer_type": "string"
+    }
+
+def summarize_data(data, limit=1000):
+    """Compact text version of data for an LLM prompt"""
+    # pandas is only loaded once a file has been parsed
+    if _pd is not None and isinstance(data, _pd.DataFrame):
+        return data.head(20).to_csv(index=False)[:limit]
+    if isinstance(data, (dict, list)):
+        try:
+            return orjson.dumps(data).decode('utf-8')[:limit]
+        except TypeError:
+            pass
+    return str(data)[:limit]
 
 def generate_answer(task_info, data):
     """Ask LLM to give the final answer"""
     prompt = f"""Based on this information, give me the answer.
 
 Task: {task_info.get('instructions', '')}
-Data: {str(data)[:1000]}
+Data: {summarize_data(data)}
 
 Give ONLY the answer, nothing else."""
 
-    response = model.generate_content(prompt)
-    answer = response.text.strip()
+    # Not cached: a retry after a wrong answer should get a fresh one
+    answer = ask_llm(prompt)
     
     # Clean up answer
     answer_type = task_info.get('answer_type', 'string')
     
     if answer_type == 'number':
-        # Extract number from text
-        nums = re.findall(r'-?\d+\.?\d*', answer)
-        if nums:
-            return float(nums[0]) if '.' in nums[0] else int(nums[0])
+        # Usually the LLM replies with just the number
+        try:
+            num = int(answer) if answer.lstrip('-').isdigit() else float(answer)
+            if math.isfinite(num):  # float() also accepts "nan" and "inf"
+                return num
+        except ValueError:
+            pass
+        
+        # Otherwise extract the first number from text
+        match = _NUM_RE.search(answer)
+        if match:
+            num = match.group()
+            return float(num) if '.' in num else int(num)
         return 0
     
     return answer
 
 
+# ===== HTTP Client =====
+
+# Shared client so downloads and submissions reuse connections
+_HTTP = httpx.AsyncClient(
+    http2=True,
+    timeout=30.0,
+    follow_redirects=True,
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
+
+async def close_http_client():
+    """Close the shared HTTP client (call on server shutdown)"""
+    await _HTTP.aclose()
+
+
 # ===== Data Processing Functions =====
 
-def download_file(url):
+async def download_file(url):
     """Download file from URL"""
     print(f"Downloading: {url}")
-    response = requests.get(url, timeout=30)
+    response = await _HTTP.get(url)
+    response.raise_for_status()
     return response.content
 
+# Serializes all PDFium calls (parse_pdf runs in worker threads)
+_PDFIUM_LOCK = threading.Lock()
+
+def _pdf_tables(file_bytes):
+    """Get tables from every PDF page with pdfplumber"""
+    import pdfplumber
+    pd = _pandas()
+    tables = []
+    with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
+        for page in pdf.pages:
+            for table in page.extract_tables():
+                if table:
+                    tables.append(pd.DataFrame(table[1:], columns=table[0]))
+    return tables
+
 def parse_pdf(file_bytes):
     """Get text and tables from PDF"""
+    import pypdfium2 as pdfium
     result = {"text": "", "tables": []}
     
-    pdf = pdfplumber.open(io.BytesIO(file_bytes))
-    
-    # Get all text
-    all_text = []
-    for i, page in enumerate(pdf.pages):
-        page_text = page.extract_text()
-        if page_text:
-            all_text.append(f"Page {i+1}:\n{page_text}")
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Table detection is the slow part, run it alongside the text pass
+        tables_job = executor.submit(_pdf_tables, file_bytes)
+        
+        # Get all text with PDFium (C++); it isn't thread-safe, even across
+        # documents, so concurrent parse_pdf calls take turns here
+        all_text = []
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(file_bytes)
+            try:
+                for i, page in enumerate(pdf):
+                    textpage = page.get_textpage()
+                    page_text = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                    if page_text.strip():
+                        all_text.append(f"Page {i+1}:\n{page_text}")
+            finally:
+                pdf.close()
         
-        # Get tables from this page
-        tables = page.extract_tables()
-        for table in tables:
-            if table:
-                df = pd.DataFrame(table[1:], columns=table[0])
-                result["tables"].append(df)
+        result["tables"] = tables_job.result()
     
     result["text"] = "\n\n".join(all_text)
-    pdf.close()
     
     return result
 
 def parse_csv(file_bytes):
-    """Parse CSV file"""
-    df = pd.read_csv(io.BytesIO(file_bytes))
+    """Parse CSV file (multithreaded pyarrow reader, default engine as fallback)"""
+    pd = _pandas()
+    try:
+        df = pd.read_csv(io.BytesIO(file_bytes), engine='pyarrow')
+    except Exception as e:
+        # pyarrow infers types per block and rejects mixed columns the C engine reads
+        print(f"⚠ pyarrow CSV read failed, using default engine: {e}")
+        df = pd.read_csv(io.BytesIO(file_bytes))
     return df
 
 def parse_excel(file_bytes):
-    """Parse Excel file"""
-    df = pd.read_excel(io.BytesIO(file_bytes))
+    """Parse Excel file (Rust calamine reader, default engine as fallback)"""
+    pd = _pandas()
+    try:
+        df = pd.read_excel(io.BytesIO(file_bytes), engine='calamine')
+    except Exception as e:
+        print(f"⚠ calamine Excel read failed, using default engine: {e}")
+        df = pd.read_excel(io.BytesIO(file_bytes))
     return df
 
 def analyze_data(df, instruction):
     """Do basic analysis on dataframe"""
     instruction_lower = instruction.lower()
     
-    # Find which column to use
-    column = None
-    for col in df.columns:
-        if col.lower() in instruction_lower:
-            column = col
-            break
+    # Find which column to use: whole-word match first, then any mention
+    cols_lower = {str(col).lower(): col for col in df.columns}
+    words = _WORD_RE.findall(instruction_lower)
+    column = next((cols_lower[w] for w in words if w in cols_lower), None)
+    if column is None:
+        column = next((col for name, col in cols_lower.items() if name in instruction_lower), None)
     
-    if not column and len(df.columns) > 0:
+    if column is None and len(df.columns) > 0:
         column = df.columns[1] if len(df.columns) > 1 else df.columns[0]
     
-    # Do the operation
-    if 'sum' in instruction_lower:
-        return df[column].sum()
-    elif 'average' in instruction_lower or 'mean' in instruction_lower:
-        return df[column].mean()
-    elif 'count' in instruction_lower:
+    # Do the operation (first keyword found wins, sum by default)
+    op = next((op for keyword, op in _OPERATIONS if keyword in instruction_lower), 'sum')
+    if op is None:
         return len(df)
-    elif 'max' in instruction_lower:
-        return df[column].max()
-    elif 'min' in instruction_lower:
-        return df[column].min()
-    else:
-        return df[column].sum()  # default
+    return getattr(df[column], op)()
 
 
 # ===== Visualization Functions =====
 
+# Matplotlib isn't thread-safe, so charts render in worker processes.
+# Workers start from a forkserver where available (spawn otherwise, e.g. on
+# Windows): forking the multi-threaded server process directly could deadlock.
+# The pool is created on the first chart.
+_CHART_POOL = None
+
+def _chart_pool():
+    """Get the chart process pool, creating it on first use"""
+    global _CHART_POOL
+    if _CHART_POOL is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _CHART_POOL = ProcessPoolExecutor(
+            max_workers=2,
+            mp_context=multiprocessing.get_context(method)
+        )
+    return _CHART_POOL
+
+def shutdown_chart_pool():
+    """Stop the chart worker processes (call on server shutdown)"""
+    if _CHART_POOL is not None:
+        _CHART_POOL.shutdown(wait=False, cancel_futures=True)
+
+# One figure per process, reused for every chart
+_FIG = None
+_AX = None
+
+def _chart_axes():
+    """Get the reusable figure, creating it on first use"""
+    global _FIG, _AX
+    if _FIG is None:
+        _FIG, _AX = _pyplot().subplots(figsize=(10, 6))
+        # Fixed margins instead of running tight_layout on every chart
+        _FIG.subplots_adjust(left=0.12, right=0.98, top=0.9, bottom=0.2)
+    return _FIG, _AX
+
 def create_chart(df, title="Chart"):
     """Make a simple bar chart"""
-    fig, ax = plt.subplots(figsize=(10, 6))
+    fig, ax = _chart_axes()
+    ax.clear()
     
     # Use first two columns
     if len(df.columns) >= 2:
@@ -171,15 +335,12 @@ def create_chart(df, title="Chart"):
         df.plot(kind='bar', ax=ax)
     
     ax.set_title(title)
-    plt.tight_layout()
     
     # Save to bytes
     buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    plt.close()
-    buf.seek(0)
+    fig.savefig(buf, format='png')
     
-    return buf.read()
+    return buf.getvalue()
 
 def to_base64(image_bytes):
     """Convert image to base64 string"""
@@ -189,24 +350,19 @@ def to_base64(image_bytes):
 
 # ===== Main Quiz Solving Logic =====
 
-async def solve_quiz(quiz_url):
-    """Solve one quiz"""
+async def solve_quiz(quiz_url, browser):
+    """Solve one quiz using an already started browser"""
     print(f"\n=== Solving quiz: {quiz_url} ===\n")
     
-    # Step 1: Get the quiz page
-    browser = QuizBrowser(headless=True)
-    await browser.start()
-    
+    # Step 1: Get the quiz page (a pooled page with a fresh context)
     page_data = await browser.visit_quiz_page(quiz_url)
     quiz_text = page_data.get('quiz_text', '')
     submit_url = page_data.get('submit_url', '')
     
-    await browser.stop()
-    
     print(f"Quiz text: {quiz_text[:200]}...")
     
     # Step 2: Ask LLM what to do
-    task_info = analyze_quiz(quiz_text)
+    task_info = await asyncio.to_thread(analyze_quiz, quiz_text)
     print(f"Task type: {task_info.get('task_type')}")
     
     # Step 3: Do the task
@@ -219,42 +375,37 @@ async def solve_quiz(quiz_url):
     if actual_files:
         # Download the file
         url = actual_files[0]
-        file_data = download_file(url)
+        file_data = await download_file(url)
         
         # Figure out what type of file
         if url.endswith('.pdf'):
-            parsed = parse_pdf(file_data)
+            parsed = await asyncio.to_thread(parse_pdf, file_data)
             if parsed['tables']:
                 df = parsed['tables'][0]
-                answer = analyze_data(df, task_info.get('instructions', ''))
+                answer = await asyncio.to_thread(analyze_data, df, task_info.get('instructions', ''))
             else:
-                answer = generate_answer(task_info, parsed['text'])
+                answer = await asyncio.to_thread(generate_answer, task_info, parsed['text'])
         
         elif url.endswith('.csv'):
-            df = parse_csv(file_data)
-            answer = analyze_data(df, task_info.get('instructions', ''))
+            df = await asyncio.to_thread(parse_csv, file_data)
+            answer = await asyncio.to_thread(analyze_data, df, task_info.get('instructions', ''))
         
         elif url.endswith(('.xlsx', '.xls')):
-            df = parse_excel(file_data)
-            answer = analyze_data(df, task_info.get('instructions', ''))
+            df = await asyncio.to_thread(parse_excel, file_data)
+            answer = await asyncio.to_thread(analyze_data, df, task_info.get('instructions', ''))
         
         # Check if we need to make a chart
         if 'chart' in quiz_text.lower() or 'visualiz' in quiz_text.lower():
-            img = create_chart(df, "Chart")
+            loop = asyncio.get_running_loop()
+            img = await loop.run_in_executor(_chart_pool(), create_chart, df, "Chart")
             answer = to_base64(img)
     else:
         # No files, just ask LLM
-        answer = generate_answer(task_info, quiz_text)
+        answer = await asyncio.to_thread(generate_answer, task_info, quiz_text)
     
     print(f"Answer: {answer}")
     
     # Step 4: Submit answer
-    if not submit_url:
-        # Try to find submit URL in text
-        urls = re.findall(r'https?://[^\s<>"]+/submit[^\s<>"]*', quiz_text)
-        if urls:
-            submit_url = urls[0]
-    
     if submit_url:
         payload = {
             "email": YOUR_EMAIL,
@@ -264,7 +415,7 @@ async def solve_quiz(quiz_url):
         }
         
         print(f"Submitting to: {submit_url}")
-        response = requests.post(submit_url, json=payload, timeout=30)
+        response = await _HTTP.post(submit_url, json=payload)
         result = response.json()
         
         print(f"Result: {result}")
@@ -277,21 +428,34 @@ async def solve_quiz(quiz_url):
     
     return {"success": False, "error": "No submit URL found"}
 
-async def solve_quiz_chain(start_url):
-    """Solve multiple quizzes in a chain"""
+async def solve_quiz_chain(start_url, browser=None):
+    """
+    Solve multiple quizzes in a chain
+    Uses the given (shared, already started) browser, or starts its own
+    """
     current_url = start_url
     results = []
     count = 0
     
-    while current_url and count < 5:  # max 5 quizzes
-        count += 1
-        result = await solve_quiz(current_url)
-        results.append(result)
-        
-        if result.get('success') and result.get('next_url'):
-            current_url = result['next_url']
-        else:
-            break
+    # One browser for the whole chain
+    own_browser = browser is None
+    if own_browser:
+        browser = QuizBrowser(headless=True)
+        await browser.start()
+    
+    try:
+        while current_url and count < 5:  # max 5 quizzes
+            count += 1
+            result = await solve_quiz(current_url, browser)
+            results.append(result)
+            
+            if result.get('success') and result.get('next_url'):
+                current_url = result['next_url']
+            else:
+                break
+    finally:
+        if own_browser:
+            await browser.stop()
     
     return {
         "success": True,
@@ -1,33 +1,55 @@
+"""
+Quiz Server - Receives quiz tasks over HTTP and solves them
+"""
+import secrets
+import sys
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import uvicorn
+from browser_module import QuizBrowser
+from config import YOUR_EMAIL, YOUR_SECRET, SERVER_PORT, HEADLESS_BROWSER, BROWSER_POOL_SIZE
+from quiz_solver import solve_quiz_chain, close_http_client, shutdown_chart_pool
+
+app = FastAPI()
+
+class QuizRequest(BaseModel):
+    email: str
     secret: str
     url: str
 
-@app.post("/quiz")
-async def handle_quiz(request: Request):
-    """Main endpoint that receives quiz tasks"""
-    
-    # Get the JSON data
-    try:
-        body = await request.json()
-    except:
+@app.exception_handler(RequestValidationError)
+async def bad_request(request: Request, exc: RequestValidationError):
+    """Invalid JSON or missing fields are a 400, not FastAPI's default 422"""
+    if any(err.get('type') == 'json_invalid' for err in exc.errors()):
         return JSONResponse(status_code=400, content={"error": "Bad JSON"})
+    return JSONResponse(status_code=400, content={"error": "Missing fields"})
+
+@app.exception_handler(HTTPException)
+async def http_error(request: Request, exc: HTTPException):
+    """Keep the {"error": ...} response shape"""
+    return JSONResponse(status_code=exc.status_code, content={"error": exc.detail})
+
+async def verify_credentials(quiz_req: QuizRequest) -> QuizRequest:
+    """Check email and secret before the quiz is solved"""
+    # Constant-time compares (on bytes, so non-ASCII input can't raise);
+    # both always run so timing doesn't reveal which one was wrong
+    email_ok = secrets.compare_digest(quiz_req.email.encode(), YOUR_EMAIL.encode())
+    secret_ok = secrets.compare_digest(quiz_req.secret.encode(), YOUR_SECRET.encode())
+    if not (email_ok and secret_ok):
+        raise HTTPException(status_code=403, detail="Invalid credentials")
     
-    # Check the data
-    try:
-        quiz_req = QuizRequest(**body)
-    except:
-        return JSONResponse(status_code=400, content={"error": "Missing fields"})
-    
-    # Verify email and secret
-    if quiz_req.email != YOUR_EMAIL:
-        return JSONResponse(status_code=403, content={"error": "Wrong email"})
-    
-    if quiz_req.secret != YOUR_SECRET:
-        return JSONResponse(status_code=403, content={"error": "Wrong secret"})
+    return quiz_req
+
+@app.post("/quiz")
+async def handle_quiz(quiz_req: QuizRequest = Depends(verify_credentials)):
+    """Main endpoint that receives quiz tasks"""
     
     print(f"\n✓ Got quiz request: {quiz_req.url}")
     
     # Solve the quiz
-    result = await solve_quiz_chain(quiz_req.url)
+    result = await solve_quiz_chain(quiz_req.url, app.state.browser)
     
     if result.get('success'):
         return JSONResponse(status_code=200, content={
@@ -40,6 +62,19 @@ async def handle_quiz(request: Request):
             "message": "Failed to solve quiz"
         })
 
+@app.on_event("startup")
+async def startup():
+    """Start one browser whose pages are shared by all quiz requests"""
+    app.state.browser = QuizBrowser(headless=HEADLESS_BROWSER, max_pages=BROWSER_POOL_SIZE)
+    await app.state.browser.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the browser, shared connections and worker processes"""
+    await app.state.browser.stop()
+    await close_http_client()
+    shutdown_chart_pool()
+
 @app.get("/")
 def home():
     """Home page"""
@@ -51,4 +86,13 @@ if __name__ == "__main__":
     print(f"Port: {SERVER_PORT}")
     print(f"\nStarting server...\n")
     
-    uvicorn.run(app, host="0.0.0.0", port=SERVER_PORT)
\ No newline at end of file
+    # uvloop event loop and httptools parser (both come with uvicorn[standard]);
+    # uvloop isn't available on Windows, so let uvicorn pick the loop there
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=SERVER_PORT,
+        loop="auto" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=1
+    )